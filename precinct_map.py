@@ -13,29 +13,26 @@ Or, if you want to use custom inputs:
 """
 
 #~~~~~~ Setup ~~~~~~#
-from itertools import count
-from turtle import fillcolor
-from xml.etree.ElementPath import ops
 import geopandas as gpd
-import json
-import zipfile
-import io
-from fiona.io import ZipMemoryFile
-import matplotlib.pyplot as plt
+import pyogrio
 import geopy
-from numpy import NaN
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
 import folium
-import mapclassify
-from shapely import ops
-from shapely.geometry.polygon import Polygon
-from shapely.geometry.multipolygon import MultiPolygon
-import json
+from matplotlib import colormaps
+from matplotlib.colors import to_hex
 import re
-import branca
 from geopy.geocoders import Nominatim
+from geopy.extra.rate_limiter import RateLimiter
+from geopy.exc import GeopyError
 from parsons import GoogleSheets
 import os
+from pathlib import Path
+import functools
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 import logging
 import gitlab
 import click
@@ -48,6 +45,51 @@ _handler.setFormatter(_formatter)
 logger.addHandler(_handler)
 logger.setLevel('INFO')
 
+#~~~~~~ Retrieve Google Sheets ~~~~~~#
+"""
+These functions pull the source data for the map from Google Sheets.
+Every sheet is fetched once per run and memoized by (gsheet_id, worksheet)
+"""
+
+ORGANIZER_ASSIGNMENT_GSHEET_ID = '1rH62dKf9STLpgvf_xO2ruzc6cWLJFeO9v4ANDofUyy0'
+STAGING_LOCATION_GSHEET_ID = '1PS7VWdefRnyp4iX9c0EfHB7pu3wbsIsjBDn094cHpJk'
+TURNOUT_COMPLETION_GSHEET_ID = '1uBzWnBHxzaiJcA3IqVX3b1mHDoUfe72VNLhNimSQykg'
+FREQ_VOL_GSHEET_ID = '1uBzWnBHxzaiJcA3IqVX3b1mHDoUfe56VNLhNimSQyni'
+
+# Identifier columns are read as text so a blank cell does not turn them into floats (e.g. '98002.0')
+STRING_COLUMNS = ['zip', 'myc_van_id', 'van_precinct_id']
+
+@functools.lru_cache(maxsize=None)
+def _get_sheets():
+    """
+    Instantiates the GoogleSheets class once per run
+
+    Returns
+        GoogleSheets
+    """
+    return GoogleSheets()
+
+@functools.lru_cache(maxsize=None)
+def _fetch_sheet(gsheet_id, worksheet):
+    """
+    Retrieves a worksheet from a gsheet as a dataframe. The worksheet is
+    parsed from csv with pyarrow so numeric columns land with numeric
+    dtypes on first pass, while identifier columns stay strings
+
+    Args
+        gsheet_id: str
+            The id of the gsheet
+        
+        worksheet: int or str
+            The index or title of the worksheet
+
+    Returns
+        dataframe
+    """
+    csv_filepath = _get_sheets().get_worksheet(gsheet_id, worksheet=worksheet).to_csv()
+    convert_options = pa_csv.ConvertOptions(column_types={col: pa.string() for col in STRING_COLUMNS})
+    return pa_csv.read_csv(csv_filepath, convert_options=convert_options).to_pandas()
+
 #~~~~~~ Generate Base GeoDataframe ~~~~~~#
 """
 These functions compile the base geodataframe for the resulting map
@@ -55,6 +97,28 @@ by merging the precinct shpefile with data assigning each precinct
 to an organizer region (A, B, C, D, E) 
 """
 
+def to_precinct_id(col, source):
+    """
+    Converts a van_precinct_id column to a nullable integer column so
+    merges on it hash fixed-width keys instead of python strings.
+    Blank or non-numeric ids become <NA> and are logged
+
+    Args
+        col: series
+            The van_precinct_id column
+
+        source: str
+            Name of the data the column came from, for logging
+
+    Returns
+        series
+    """
+    precinct_ids = pd.to_numeric(col, errors = 'coerce').astype('Int64')
+    missing = precinct_ids.isna().sum()
+    if missing:
+        logger.warning(f'{missing} blank or non-numeric van_precinct_id values in the {source}')
+    return precinct_ids
+
 def unzip_to_gdf(filepath):
     """
     Converts shapefile to a geodataframe
@@ -66,11 +130,8 @@ def unzip_to_gdf(filepath):
     Returns
         geodataframe
     """
-    zipshp = io.BytesIO(open(filepath, 'rb').read())
-    with (ZipMemoryFile(zipshp)) as memfile:
-        with memfile.open() as src:
-            crs = src.crs 
-            gdf = gpd.GeoDataFrame.from_features(src, crs = crs)
+    # pyogrio reads all records in one vectorized pass and attaches the CRS
+    gdf = pyogrio.read_dataframe(f'zip://{filepath}')
     return gdf
 
 def prec_shapefile_to_geodataframe(precinct_shapefile_filepath):
@@ -86,16 +147,23 @@ def prec_shapefile_to_geodataframe(precinct_shapefile_filepath):
     """
     precincts = unzip_to_gdf(precinct_shapefile_filepath)
     precincts.rename(columns = {'van_prec_i': 'van_precinct_id', 'van_prec_n':'VAN Precinct Name', 'c_name':'County'}, inplace = True)
-    precincts.van_precinct_id = precincts.van_precinct_id.astype(str)
+    precincts.van_precinct_id = to_precinct_id(precincts.van_precinct_id, 'precinct shapefile')
+
+    # Reproject once here, before any merge duplicates rows, so each vertex is only transformed once
+    precincts.set_crs('epsg:3857', allow_override = True, inplace = True)
+    precincts = precincts.to_crs('epsg:4326')
     return precincts
 
-def get_organizer_assignment(sheets):
+def get_organizer_assignment(number_assignment_raw, organizer_assignment_raw):
     """
     Creates dataframe of organizer and region number assignment to each precinct
 
     Arg 
-        sheets: Google Sheets
-            Instantiated google sheet class
+        number_assignment_raw: df
+            raw number assignment worksheet
+        
+        organizer_assignment_raw: df
+            raw organizer assignment worksheet
     
     Returns
         dataframe
@@ -103,23 +171,22 @@ def get_organizer_assignment(sheets):
 
     # The district is split into numbered regions (1-10).
     # Here, we are pulling the number assignment for each precinct from a gsheet (which are updated by Organizing Director)
-    gsheet_id = '1rH62dKf9STLpgvf_xO2ruzc6cWLJFeO9v4ANDofUyy0'
-    number_assignment_raw = sheets.get_worksheet(gsheet_id, worksheet=0).to_dataframe().iloc[:, :4]
-    number_assignment_cleaned = pd.DataFrame(number_assignment_raw.iloc[1:, :])
-    number_assignment_cleaned.columns = number_assignment_raw.iloc[0, 0:]
-    number_assignment_cleaned = number_assignment_cleaned.reset_index(drop = True).drop(['SSD','SHD'], axis = 1)
-    number_assignment_cleaned.rename(columns = {'VAN Turf' : 'Turf', 'VAN Precinct ID':'van_precinct_id'}, inplace = True)
+    number_assignment = number_assignment_raw.iloc[:, :4]
+    number_assignment.columns = number_assignment.iloc[0]
+    number_assignment = number_assignment.iloc[1:].rename(columns = {'VAN Turf' : 'Turf', 'VAN Precinct ID':'van_precinct_id'}).drop(columns = ['SSD','SHD'])
+    number_assignment.van_precinct_id = to_precinct_id(number_assignment.van_precinct_id, 'number assignment sheet')
+
+    # pandas matches <NA> keys to each other, so rows without an id are dropped before merging
+    number_assignment = number_assignment.dropna(subset = ['van_precinct_id'])
     
     # The ten numbered regions are then split between organizing teams A-E
     # Here, we are pulling the organizing team assignment for each numbered region from the same ghseet   
-    organizer_assignment_raw = sheets.get_worksheet(gsheet_id, worksheet=1).to_dataframe().iloc[:, :2]
-    organizer_assignment_cleaned = pd.DataFrame(organizer_assignment_raw.iloc[1:, :]).reset_index(drop = True)
-    organizer_assignment_cleaned.columns = organizer_assignment_raw.iloc[0]
+    organizer_assignment = organizer_assignment_raw.iloc[:, :2]
+    organizer_assignment.columns = organizer_assignment.iloc[0]
+    organizer_assignment = organizer_assignment.iloc[1:]
     
     # Here, we merge the numbered assignment with the organizing team assignment
-    organizer_number_assignment = number_assignment_cleaned.merge(organizer_number_assignment, how = 'left', on = 'Turf')
-    
-    return organizer_number_assignment
+    return number_assignment.merge(organizer_assignment, how = 'left', on = 'Turf')
 
 def generate_organizer_assignment_gdf(precincts, organizer_assignment):
     """
@@ -136,11 +203,12 @@ def generate_organizer_assignment_gdf(precincts, organizer_assignment):
         geodataframe
     """
 
-    precincts_assigned = precincts.merge(organizer_assignment, how = 'left', on = 'van_precinct_id')
-    precincts_assigned_drop_na = precincts_assigned[~precincts_assigned.geometry.isna()]
-    precincts_assigned_drop_na.set_crs('epsg:3857', inplace = True).to_crs('epsg:4326', inplace = True)
+    precincts_assigned = precincts.merge(organizer_assignment, how = 'left', on = 'van_precinct_id').dropna(subset = ['geometry'])
+
+    # Store the low-cardinality grouping columns as categoricals so groupbys only visit observed keys
+    precincts_assigned = precincts_assigned.astype({col: 'category' for col in ['Turf', 'Organizer', 'County', 'LD']})
     
-    return precincts_assigned_drop_na
+    return precincts_assigned
 
 #~~~~~~~~~ Generate Additional Map Layers ~~~~~~~~~#
 """
@@ -148,6 +216,31 @@ These functions generate additional map layers using
 the base geodataframe.
 """
 
+def agg_string_columns(gdf, by, columns):
+    """
+    Combines the unique strings in each column per group into
+    comma-separated aggregated lists
+
+    Arg
+        gdf: gdf
+            geodataframe to aggregate
+
+        by: str
+            column to groupby
+
+        columns: list
+            string columns to aggregate
+
+    Returns
+        dataframe
+    """
+
+    # Arrow-backed strings let dropna/unique run on columnar buffers
+    string_columns = gdf[[by] + columns].astype({col: pd.ArrowDtype(pa.string()) for col in columns})
+    join_unique = lambda col: ', '.join(pd.unique(col.dropna()))
+
+    return string_columns.groupby(by, sort = False, observed = True, as_index = False)[columns].agg(join_unique)
+
 def group_by_col(precincts_assigned, col_name):
     """
     Groups and aggregates the precinct geodataframe by a given column name and
@@ -165,134 +258,176 @@ def group_by_col(precincts_assigned, col_name):
         geodataframe
     """
 
-    # create dictionary to aggregate the geometry column together
-    # and combine strings in other columns to create aggregated lists
-    agg_string_columns = lambda row: ', '.join(row.drop_duplicates().dropna().astype(str))
-    agg_dic = {'geometry':ops.unary_union, 'Organizer':agg_string_columns, 'Turf':agg_string_columns, 'County':agg_string_columns, 'LD':agg_string_columns}
-    
-    # group by given column name and apply the aggregation functions
-    # and generate resulting geodataframe
-    precincts_grouped = precincts_assigned.groupby(col_name).agg(agg_dic)
-    precincts_grouped.drop(columns = [col_name], inplace = True)
-    precincts_grouped.reset_index(inplace = True)
-    precincts_grouped.set_geometry(col='geometry', inplace=True)
-    precincts_grouped.set_crs('epsg:4326', inplace = True)
+    # dissolve the geometry column together by the given column name
+    precincts_grouped = precincts_assigned[[col_name, 'geometry']].dissolve(by = col_name, sort = False, observed = True, as_index = False)
+
+    # combine strings in other columns to create aggregated lists
+    # and merge them onto the resulting geodataframe
+    string_columns = [col for col in ['Organizer', 'Turf', 'County', 'LD'] if col != col_name]
+    precincts_grouped = precincts_grouped.merge(agg_string_columns(precincts_assigned, col_name, string_columns), on = col_name)
+
+    # count the precincts in each group
+    precinct_counts = precincts_assigned.groupby(col_name, sort = False, observed = True, as_index = False).size()
+    precincts_grouped = precincts_grouped.merge(precinct_counts.rename(columns = {'size': 'Total Precincts'}), on = col_name)
 
     return precincts_grouped
 
-def generate_staging_location_gdf(sheets,precincts_assigned):
+def generate_staging_location_gdf(sl_turnout, precincts_assigned_idx):
     """
     Generates the geodataframe for staging location map layer
 
     Arg:
 
-        sheets: GoogleSheets
-            Instantaited GoogleSheets class
+        sl_turnout: df
+            precinct-staging location assignment worksheet
 
-        precincts_assigned: gdf
-            precinct assigned to organizers geodataframe
+        precincts_assigned_idx: gdf
+            precinct assigned to organizers geodataframe indexed by van_precinct_id
         
     Returns:
         geodataframe
     """
-    gsheet_id = '1PS7VWdefRnyp4iX9c0EfHB7pu3wbsIsjBDn094cHpJk'
-
-    worksheet = 'staging_location_assignment'
-
-    # Retrieve precinct-staging location assignment information from gsheet
-    sl_turnout = sheets.get_worksheet(gsheet_id, worksheet=worksheet).to_dataframe()
-    sl_turnout.van_precinct_id = sl_turnout.van_precinct_id.astype(str)
+    sl_turnout = sl_turnout.copy()
+    sl_turnout.van_precinct_id = to_precinct_id(sl_turnout.van_precinct_id, 'staging location sheet')
 
     # Merge precinct shapefile with precinct-staging location assignment dataframe
-    sl_turnout_gdf = precincts_assigned.merge(sl_turnout, how='right', on='van_precinct_id')
+    # pandas matches <NA> keys to each other, so rows without an id are dropped before joining
+    sl_turnout_gdf = precincts_assigned_idx.join(sl_turnout.dropna(subset = ['van_precinct_id']).set_index('van_precinct_id'), how = 'right')
     sl_turnout_drop_na = sl_turnout_gdf[~sl_turnout_gdf.geometry.isna()]
 
     # Group and aggregate shapefile to produce staging location-level geodataframe 
-    agg_func = lambda row: ', '.join(row.drop_duplicates().dropna().astype(str))
-    gdf_sl = sl_turnout_drop_na.groupby('staging_loc').agg({'geometry': ops.unary_union, 'County' : agg_func, 'LD': agg_func})
-    df_sub = pd.DataFrame(sl_turnout.groupby('staging_loc').sum(['total_people', 'total_households'])).reset_index()
-    gdf_sl = gdf_sl.reset_index()
+    gdf_sl = sl_turnout_drop_na[['staging_loc', 'geometry']].dissolve(by = 'staging_loc', sort = False, observed = True, as_index = False)
+    gdf_sl = gdf_sl.merge(agg_string_columns(sl_turnout_drop_na, 'staging_loc', ['County', 'LD']), on = 'staging_loc')
+    df_sub = sl_turnout.groupby('staging_loc', sort = False, observed = True, as_index = False)[['total_people', 'total_households']].sum()
     gdf_sl = gdf_sl.merge(df_sub, on = 'staging_loc')
-    gdf_sl = gdf_sl.set_geometry(col='geometry')
-    gdf_sl.set_crs('epsg:4326', inplace = True)
 
     return gdf_sl
 
-def generate_turnout_completion_gdf(sheets, precincts_assigned):
+def generate_turnout_completion_gdf(turnout_completion, precincts_assigned_idx):
     """
     Generates geodataframe for map layer to track percentage door knocking completion
     per precinct
 
     Arg
 
-        sheets: GoogleSheets
-            Instantaited GoogleSheets class
+        turnout_completion: df
+            turnout completion worksheet
 
-        precincts_assigned: gdf
-            precinct geodataframe
+        precincts_assigned_idx: gdf
+            precinct geodataframe indexed by van_precinct_id
 
     Returns
         gdf
     """
 
-    gsheet_id = '1uBzWnBHxzaiJcA3IqVX3b1mHDoUfe72VNLhNimSQykg'
-    worksheet = 'turnout_completion'
+    turnout_completion = turnout_completion.copy()
+    turnout_completion.van_precinct_id = to_precinct_id(turnout_completion.van_precinct_id, 'turnout completion sheet')
+    turnout_completion = turnout_completion.dropna(subset = ['van_precinct_id'])
 
-    # Retrieve turnout completion data from gsheet
-    turnout_completion = sheets.get_worksheet(gsheet_id, worksheet=worksheet).to_dataframe()
-    turnout_completion.van_precinct_id = turnout_completion.van_precinct_id.astype(str)
-
-    # Merge turnout completion data with precinct shapefile 
-    turnout_completion_gdf = precincts_assigned.merge(turnout_completion, how = 'left', on = 'van_precinct_id')
-    turnout_completion_gdf['percentage_not_attempted'] = turnout_completion_gdf['percentage_not_attempted'].astype(float)
-    turnout_completion_gdf['percentage_not_attempted_nv'] = turnout_completion_gdf['percentage_not_attempted_nv'].astype(float)
+    # Merge turnout completion data with precinct shapefile. Rows without an id were dropped
+    # above since pandas matches <NA> keys to each other
+    turnout_completion_gdf = precincts_assigned_idx.join(turnout_completion.set_index('van_precinct_id'), how = 'left').reset_index()
 
     return turnout_completion_gdf
 
-def generate_freq_vol_gdf(sheets):
+GEOCODE_CACHE_FILEPATH = 'geocode_cache.parquet'
+
+def geocode(queries):
+    """
+    Geocodes address strings with Nominatim. Each unique string is only geocoded
+    once and results are persisted to a local parquet file so later runs
+    skip the network for anything already geocoded
+
+    Arg
+        queries: series
+            address strings to geocode
+
+    Returns
+        gdf
+    """
+
+    if os.path.exists(GEOCODE_CACHE_FILEPATH):
+        cache = pd.read_parquet(GEOCODE_CACHE_FILEPATH)
+    else:
+        cache = pd.DataFrame({'query': pd.Series(dtype = object), 'address': pd.Series(dtype = object),
+            'latitude': pd.Series(dtype = float), 'longitude': pd.Series(dtype = float)})
+
+    # Geocode the unique queries missing from the cache. Requests overlap across threads
+    # while the rate limiter keeps them within Nominatim's 1 request/second policy
+    new_queries = queries.drop_duplicates()
+    new_queries = new_queries[~new_queries.isin(cache['query'])].to_numpy()
+    if len(new_queries):
+        geopy.geocoders.options.default_user_agent = "sharine@drkimschrier.com"
+        rate_limited_geocode = RateLimiter(Nominatim().geocode, min_delay_seconds = 1, swallow_exceptions = False)
+
+        # Errors (timeouts, rate limiting) are logged and left out of the cache so the query is retried next run
+        def try_geocode(query):
+            try:
+                return True, rate_limited_geocode(query)
+            except GeopyError as error:
+                logger.warning(f'Geocoding {query!r} failed, will retry next run: {error}')
+                return False, None
+
+        with ThreadPoolExecutor(max_workers = 8) as executor:
+            results = list(executor.map(try_geocode, new_queries))
+        new_queries = [query for query, (succeeded, _) in zip(new_queries, results) if succeeded]
+        locations = [location for succeeded, location in results if succeeded]
+
+        # Queries with no match are cached too, with missing coordinates, so they are not retried every run
+        geocoded = pd.DataFrame({'query': new_queries,
+            'address': [loc.address if loc else None for loc in locations],
+            'latitude': np.array([loc.latitude if loc else np.nan for loc in locations], dtype = float),
+            'longitude': np.array([loc.longitude if loc else np.nan for loc in locations], dtype = float)})
+        cache = pd.concat([cache, geocoded], ignore_index = True)
+        cache.to_parquet(GEOCODE_CACHE_FILEPATH, index = False)
+
+    # Look up the coordinates for every successfully geocoded query
+    found = cache.dropna(subset = ['latitude']).set_index('query')
+    matched = queries[queries.isin(found.index)]
+    coords = found.loc[matched.to_numpy()]
+
+    return gpd.GeoDataFrame({'address': coords['address'].to_numpy()},
+        geometry = gpd.points_from_xy(coords['longitude'].to_numpy(), coords['latitude'].to_numpy(), crs = 'EPSG:4326'),
+        index = matched.index)
+
+def generate_freq_vol_gdf(addresses):
     """
     Generates geodataframe for map layer plotting most frequent canvassars
 
     Arg
 
-        sheets: GoogleSheets
-            Instantaited GoogleSheets class
+        addresses: df
+            volunteer addresses worksheet
 
     Returns
         gdf
     """
 
-    gsheet_id = '1uBzWnBHxzaiJcA3IqVX3b1mHDoUfe56VNLhNimSQyni'
-    worksheet = 'volunteer_addresses'
-
-    # Retrieve data from gsheet containing percentage door-knock completion data from gsheet
-    addresses = sheets.get_worksheet(gsheet_id, worksheet=worksheet).to_dataframe()
+    addresses = addresses.astype({'address': 'string[pyarrow]', 'city': 'string[pyarrow]', 'state': 'string[pyarrow]', 'zip': 'string[pyarrow]'})
     addresses['myc_van_id'] = addresses['myc_van_id'].astype(str)
 
+    # Build the row masks once and reuse them below
+    lat_is_zero = addresses.latitude.eq(0)
+    addr_exists = addresses.address_exists.eq(1)
+    mask_addr = lat_is_zero & addr_exists
+    mask_city = lat_is_zero & addresses.address_exists.eq(0)
+    mask_have_coords = ~lat_is_zero
+
     # Create gdf for volunteers with geocoded addresses
-    addresses_with_lat_lon = addresses[addresses.latitude != '0']
+    addresses_with_lat_lon = addresses.loc[mask_have_coords]
     addresses_gdf = gpd.GeoDataFrame(addresses_with_lat_lon, geometry=gpd.points_from_xy(addresses_with_lat_lon.longitude, addresses_with_lat_lon.latitude, crs="EPSG:4326"))
-    addresses_gdf.to_crs('epsg:4326', inplace = True)
-
-    # Geocode addresses without geocoded addresses and create gdf
-    addresses_to_geocode = addresses[(addresses.latitude == '0') & (addresses.address_exists == '1')]
-    geopy.geocoders.options.default_user_agent = "sharine@drkimschrier.com"
-    addresses_geocoded_1 = gpd.tools.geocode(addresses_to_geocode.address.str.cat([addresses_to_geocode['state'], addresses_to_geocode['zip'].astype(str)], ', '), provider=Nominatim)
-    addresses_geocoded_cleaned_1 = addresses_geocoded_1[~addresses_geocoded_1['geometry'].is_empty]
-    addresses_geocoded_cleaned_1.to_crs('epsg:4326', inplace = True)
-    addresses_gdf_sub_1 = addresses_geocoded_cleaned_1.merge(addresses_to_geocode, left_index=True, right_index=True)
-    addresses_gdf_sub_1.drop(['address_x', 'address_y'], axis = 1, inplace = True)
-
-    # Geocode cities for volunteers without addresses and create gdf
-    cities_to_geocode = addresses[(addresses.latitude == '0') & (addresses.address_exists == '0')]
-    addresses_geocoded_2 = gpd.tools.geocode((cities_to_geocode['city'].str.cat([cities_to_geocode['state'], cities_to_geocode['zip'].astype(str)], ', ')), provider=Nominatim)
-    addresses_geocoded_cleaned_2 = addresses_geocoded_2[~addresses_geocoded_2['geometry'].is_empty]
-    addresses_geocoded_cleaned_2.to_crs('epsg:4326', inplace = True)
-    addresses_gdf_sub_2= addresses_geocoded_cleaned_2.merge(cities_to_geocode, left_index=True, right_index=True)
-    addresses_gdf_sub_2.drop(['address_x', 'address_y'], axis = 1, inplace = True)
+
+    # Geocode volunteers without geocoded addresses in a single pass, using their address
+    # when it exists and falling back to their city otherwise, and create gdf
+    addresses_to_geocode = addresses.loc[mask_addr | mask_city]
+    locality = ', ' + addresses_to_geocode['state'] + ', ' + addresses_to_geocode['zip']
+    queries = (addresses_to_geocode['address'] + locality).where(addr_exists.loc[addresses_to_geocode.index], addresses_to_geocode['city'] + locality)
+    addresses_geocoded = geocode(queries)
+    addresses_gdf_sub = addresses_geocoded.merge(addresses_to_geocode, left_index=True, right_index=True)
+    addresses_gdf_sub.drop(['address_x', 'address_y'], axis = 1, inplace = True)
 
     # Merge all geodataframes from above
-    addresses_gdf = gpd.GeoDataFrame(pd.concat([addresses_gdf, addresses_gdf_sub_1, addresses_gdf_sub_2], ignore_index=True), crs = addresses_gdf.crs)
+    addresses_gdf = gpd.GeoDataFrame(pd.concat([addresses_gdf, addresses_gdf_sub], ignore_index = True), crs = addresses_gdf.crs)
 
     return addresses_gdf
 
@@ -301,6 +436,65 @@ def generate_freq_vol_gdf(sheets):
 This function create the Folium html map
 """
 
+# ~5m at WA latitude. This trades some boundary detail at street-level zoom
+# for a smaller html map
+SIMPLIFY_TOLERANCE = 0.00005
+
+def simplify_geometry(gdf):
+    """
+    Simplifies the polygons of a map layer to shrink the html map. Each layer
+    tiles the district, so the whole layer is simplified as one coverage and
+    neighbouring polygons keep sharing the same simplified border
+
+    Arg
+        gdf: gdf
+            geodataframe to simplify
+
+    Return
+        gdf
+    """
+    return gdf.assign(geometry = gdf.geometry.simplify_coverage(SIMPLIFY_TOLERANCE))
+
+def category_colors(values, cmap):
+    """
+    Assigns a color from a matplotlib colormap to each unique value
+
+    Arg
+        values: series
+            values to color
+        cmap: str
+            name of the matplotlib colormap
+
+    Return
+        dict
+    """
+    categories = sorted(values.dropna().unique())
+    palette = colormaps[cmap].resampled(len(categories))
+    return {category: to_hex(palette(i)) for i, category in enumerate(categories)}
+
+def add_categorical_legends(map, legends):
+    """
+    Adds legends listing the color of each category to the map,
+    stacked in a single scrollable container
+
+    Arg
+        map: folium map
+            map to add the legends to
+        legends: dict
+            color for each category, keyed by legend title
+
+    Return
+        None
+    """
+    sections = ''
+    for title, color_map in legends.items():
+        items = ''.join(f'<div><span style="background:{color};width:12px;height:12px;display:inline-block;margin-right:4px"></span>{category}</div>'
+            for category, color in color_map.items())
+        sections += f'<div style="margin-bottom:6px"><b>{title}</b>{items}</div>'
+    legend = (f'<div style="position:fixed;bottom:20px;right:20px;z-index:9999;background:white;padding:6px;'
+        f'border-radius:4px;font-size:12px;max-height:60vh;overflow-y:auto">{sections}</div>')
+    map.get_root().html.add_child(folium.Element(legend))
+
 def to_map(map_filepath, organizer, counties, ld, addresses, staging_location, precincts, turnout_completion):
     """
     Generates the layers of the Folium html map
@@ -325,60 +519,92 @@ def to_map(map_filepath, organizer, counties, ld, addresses, staging_location, p
         html file
     """
 
+    # Simplify every polygon layer before Folium serializes its vertices to GeoJSON
+    organizer, counties, ld, staging_location, precincts, turnout_completion = (simplify_geometry(gdf)
+        for gdf in [organizer, counties, ld, staging_location, precincts, turnout_completion])
+
+    # Create the base map fit to the district
+    min_x, min_y, max_x, max_y = organizer.total_bounds
+    map = folium.Map(tiles = 'OpenStreetMap', control_scale = True)
+    map.fit_bounds([[min_y, min_x], [max_y, max_x]])
+
+    # Precompute the color for each category once instead of binning per layer
+    organizer_colors = category_colors(organizer['Organizer'], 'Set1')
+    county_colors = category_colors(counties['County'], 'Paired')
+    ld_colors = category_colors(ld['LD'], 'tab20')
+
+    # Both organizer layers share one GeoJSON object
+    organizer_geojson = organizer.__geo_interface__
+
     # Generate map layer showing outline of organizer regions
-    map = organizer.explore(name = 'Organizers Outline',
-                        column = 'Organizer',
-                        legend = False,
-                        show = False,
-                        cmap = 'Set1',
-                        style_kwds= {'weight': '3.5', 'fillOpacity': 0.0},
-                        highlight_kwds = {'fillOpacity': 0.5},
-                        tooltip = ['Organizer', 'Turf'],
-                        popup = ['Organizer', 'Turf', "County", 'LD', 'Total Precincts'])
-    
+    folium.GeoJson(
+        data = organizer_geojson,
+        name = 'Organizers Outline',
+        show = False,
+        style_function = lambda x: {
+            'fillOpacity': 0.0,
+            'color': organizer_colors.get(x['properties']['Organizer'], 'grey'),
+            'weight': 3.5,
+            'fillColor': organizer_colors.get(x['properties']['Organizer'], 'grey')},
+        highlight_function = lambda x: {'fillOpacity': 0.5},
+        tooltip = folium.GeoJsonTooltip(['Organizer', 'Turf']),
+        popup = folium.GeoJsonPopup(['Organizer', 'Turf', "County", 'LD', 'Total Precincts'])
+    ).add_to(map)
+
     # Generate map layer showing organizer regions filled
-    organizer.explore(name = 'Organizers Filled',
-                        column = 'Organizer',
-                        legend = True,
-                        show = False,
-                        cmap = 'Set1',
-                        highlight_kwds = {'fillOpacity': 0.5},
-                        tooltip = ['Organizer', 'Turf'],
-                        popup = ['Organizer', 'Turf', "County", 'LD', 'Total Precincts'],
-                        m = map)
-    
+    folium.GeoJson(
+        data = organizer_geojson,
+        name = 'Organizers Filled',
+        show = False,
+        style_function = lambda x: {
+            'fillOpacity': 0.5,
+            'color': organizer_colors.get(x['properties']['Organizer'], 'grey'),
+            'weight': 2,
+            'fillColor': organizer_colors.get(x['properties']['Organizer'], 'grey')},
+        highlight_function = lambda x: {'fillOpacity': 0.75},
+        tooltip = folium.GeoJsonTooltip(['Organizer', 'Turf']),
+        popup = folium.GeoJsonPopup(['Organizer', 'Turf', "County", 'LD', 'Total Precincts'])
+    ).add_to(map)
+
     # Generate map layer showing counties
-    counties.explore(name = 'Counties',
-                    show = False,
-                    column = 'County',
-                    cmap = 'Paired',
-                    tooltip = ['County'],
-                    popup = ['County', 'LD', 'Organizer', 'Turf', 'Total Precincts'],
-                    style_kwds= {'stroke': False, 'fillOpacity': 0.45},
-                    m = map)
-    
+    folium.GeoJson(
+        data = counties.__geo_interface__,
+        name = 'Counties',
+        show = False,
+        style_function = lambda x: {
+            'stroke': False,
+            'fillOpacity': 0.45,
+            'fillColor': county_colors.get(x['properties']['County'], 'grey')},
+        highlight_function = lambda x: {'fillOpacity': 0.75},
+        tooltip = folium.GeoJsonTooltip(['County']),
+        popup = folium.GeoJsonPopup(['County', 'LD', 'Organizer', 'Turf', 'Total Precincts'])
+    ).add_to(map)
+
     # Generate map layer showing legislative districts
-    ld.explore(name = 'Legislative Districts',
-                show = False,
-                column = 'LD',
-                cmap = 'tab20',
-                tooltip = ['LD'],
-                popup = ['LD', 'County','Organizer', 'Turf', 'Total Precincts'],
-                        style_kwds= {'stroke': False, 'fillOpacity': 0.45},
-                        categorical = True,
-                        m = map)
+    folium.GeoJson(
+        data = ld.__geo_interface__,
+        name = 'Legislative Districts',
+        show = False,
+        style_function = lambda x: {
+            'stroke': False,
+            'fillOpacity': 0.45,
+            'fillColor': ld_colors.get(x['properties']['LD'], 'grey')},
+        highlight_function = lambda x: {'fillOpacity': 0.75},
+        tooltip = folium.GeoJsonTooltip(['LD']),
+        popup = folium.GeoJsonPopup(['LD', 'County','Organizer', 'Turf', 'Total Precincts'])
+    ).add_to(map)
+
+    # Add the legends explore used to draw for the organizer, county and legislative district layers
+    add_categorical_legends(map, {'Organizer': organizer_colors, 'County': county_colors, 'LD': ld_colors})
 
     # Generate map layer showing active canvassers
-    addresses.explore(
+    folium.GeoJson(
+        data = addresses.__geo_interface__,
         name = 'Active Canvassers',
-        color = 'red',
-        marker_type = 'circle_marker',
-        marker_kwds = {'radius':'5'},
         show = False,
-        tooltip = False,
-        popup = ['myc_van_id', 'first_name', 'last_name', 'address', 'city', 'state', 'canvasses_attended'],
-        m = map
-        )
+        marker = folium.CircleMarker(radius = 5, color = 'red', fill = True, fill_color = 'red', fill_opacity = 0.5),
+        popup = folium.GeoJsonPopup(['myc_van_id', 'first_name', 'last_name', 'address', 'city', 'state', 'canvasses_attended'])
+    ).add_to(map)
 
     # Generate map layer showing staging locations
     folium.GeoJson(
@@ -465,30 +691,39 @@ def add_search_bar(map_filepath):
     url_js = '<script src="https://unpkg.com/leaflet-geosearch@latest/dist/geosearch.umd.js"></script>'
     url_css = '<link rel="stylesheet" href="https://unpkg.com/leaflet-geosearch@latest/dist/geosearch.css"/>'
 
-    lookup_1 = '<link rel="stylesheet" href="https://cdn.jsdelivr.net/gh/python-visualization/folium/folium/templates/leaflet.awesome.rotate.min.css"/>'
-    lookup_2 = 'var map'
+    lookup = '<link rel="stylesheet" href="https://cdn.jsdelivr.net/gh/python-visualization/folium/folium/templates/leaflet.awesome.rotate.min.css"/>'
+
+    html_txt = Path(map_filepath).read_text()
+
+    # Load the geosearch script and stylesheet after folium's stylesheets
+    html_txt = html_txt.replace(lookup, lookup + '\n' + url_js + '\n' + url_css + '\n', 1)
+
+    # Add the search control right after the map is created
+    add_search = lambda match: (match.group(0) + '\n' +
+        f'const search = new GeoSearch.GeoSearchControl({{provider: new GeoSearch.OpenStreetMapProvider()}}); map_{match.group(1)}.addControl(search)' + '\n')
+    html_txt = re.sub(r'var map_(\w+) = L\.map\(.*?\);', add_search, html_txt, count = 1, flags = re.DOTALL)
+
+    Path(map_filepath).write_text(html_txt)
 
-    # with is like your try .. finally block in this case
-    with open(map_filepath, 'r') as file:
-        # read a list of lines into data
-        html_txt = file.readlines()
+def map_digest(html_bytes):
+    """
+    Hashes the html map with folium's random element ids
+    (map_<hex>, geo_json_<hex>, ...) normalized, so two renders
+    of the same data hash the same
 
-    for num, line in enumerate(html_txt, 1):
-        if lookup_1 in line:
-            html_txt.insert(num, '\n' + url_js + '\n' + url_css + '\n\n')
-        elif lookup_2 in line:
-            map_id_group = re.search('_(.*) =', line)
-            map_id = map_id_group.group(1)
-            add_search = f'const search = new GeoSearch.GeoSearchControl({{provider: new GeoSearch.OpenStreetMapProvider()}}); map_{map_id}.addControl(search)'
-            html_txt.insert(num + 10, '\n' + add_search + '\n\n')
+    Arg:
+        html_bytes: bytes
+            contents of the html map
 
-    # and write everything back
-    with open(map_filepath, 'w') as file:
-        file.writelines(html_txt)
+    Returns
+        str
+    """
+    return hashlib.sha256(re.sub(rb'_[0-9a-f]{32}', b'_', html_bytes)).hexdigest()
 
 def update_repo(map_filepath):
     """
-    Updates 
+    Updates the map in the gitlab repo, skipping the upload
+    when the map has not changed
 
     Arg:
         map_filepath: str
@@ -497,17 +732,19 @@ def update_repo(map_filepath):
     Returns
         None
     """  
-    import base64
-    HtmlFile = open(map_filepath, 'r', encoding='utf-8')
-    with open(map_filepath, 'rb') as my_file:
-        contents = base64.b64encode(my_file.read()).decode('utf-8')
-    source_code = HtmlFile.read() 
+    html_bytes = Path(map_filepath).read_bytes()
 
     gl = gitlab.Gitlab("https://gitlab.com/", private_token= os.getenv('GITLAB_API'))
     project = gl.projects.get(39353898)
 
     file = project.files.get(file_path=map_filepath, ref="main")
-    file.content = source_code
+
+    # Compare against the stored file (decoded from base64) so identical maps are not re-uploaded
+    if map_digest(html_bytes) == map_digest(file.decode()):
+        logger.info('Map is unchanged, skipping upload')
+        return
+
+    file.content = html_bytes.decode('utf-8')
     file.save(branch='main', commit_message='Replace index.html')
 
 #~~~~~~~~~~ Call Functions and Create Map ~~~~~~~~~#
@@ -519,17 +756,33 @@ def main(precinct_shapefile_filepath, map_filepath):
     Creates
     
     """
-    sheets = GoogleSheets()
+    # Fetch the independent gsheets concurrently so the network round-trips overlap
+    gsheet_ids, worksheets = zip(
+        (ORGANIZER_ASSIGNMENT_GSHEET_ID, 0),
+        (ORGANIZER_ASSIGNMENT_GSHEET_ID, 1),
+        (STAGING_LOCATION_GSHEET_ID, 'staging_location_assignment'),
+        (TURNOUT_COMPLETION_GSHEET_ID, 'turnout_completion'),
+        (FREQ_VOL_GSHEET_ID, 'volunteer_addresses'))
+    _get_sheets()  # authenticate once before the worker threads share the client
+    with ThreadPoolExecutor(max_workers=len(gsheet_ids)) as executor:
+        (number_assignment_raw, organizer_assignment_raw, sl_turnout,
+            turnout_completion_raw, addresses_raw) = executor.map(_fetch_sheet, gsheet_ids, worksheets)
 
     precincts = prec_shapefile_to_geodataframe(precinct_shapefile_filepath)
-    organizer_assignment = get_organizer_assignment(sheets)
+    organizer_assignment = get_organizer_assignment(number_assignment_raw, organizer_assignment_raw)
     precincts_assigned = generate_organizer_assignment_gdf(precincts, organizer_assignment)
 
-    organizer, counties, ld = (group_by_col(col_name) for col_name in ['Turf', 'County', 'LD'])
-    staging_location = generate_staging_location_gdf(sheets, precincts_assigned)
-    turnout_completion = generate_turnout_completion_gdf(sheets, precincts_assigned)
-    addresses = generate_freq_vol_gdf(sheets)
+    organizer, counties, ld = (group_by_col(precincts_assigned, col_name) for col_name in ['Turf', 'County', 'LD'])
+
+    # Index the precincts once and reuse it for every precinct-keyed join
+    precincts_assigned_idx = precincts_assigned.set_index('van_precinct_id')
+    staging_location = generate_staging_location_gdf(sl_turnout, precincts_assigned_idx)
+    turnout_completion = generate_turnout_completion_gdf(turnout_completion_raw, precincts_assigned_idx)
+    addresses = generate_freq_vol_gdf(addresses_raw)
     
     to_map(map_filepath, organizer, counties, ld, addresses, staging_location, precincts, turnout_completion)
     add_search_bar(map_filepath)
-    update_repo(map_filepath)
\ No newline at end of file
+    update_repo(map_filepath)
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file